@@ -4,8 +4,14 @@ import pandas as pd
 import numpy as np
 import altair as alt
 from datetime import timedelta, datetime
+import io
 import os
 import hashlib
+import threading
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as pa_ds
+from collections import OrderedDict, namedtuple
 try:
     import duckdb
     USE_DUCKDB = True
@@ -17,164 +23,345 @@ except Exception:
 DATA_PATH_SINGLE = "data/processed/nyc311_clean.parquet"
 DATA_PATH_PART = "data/processed_part/**/*.parquet"
 SUMMARIES_DIR = "data/summaries"
+# on-disk database so views/settings survive restarts; the object cache keeps Parquet
+# footers and statistics in memory between queries
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", "data/.duck.db")
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "4GB")
+# (date, borough, complaint_type, hour) rollup written by scripts/precompute_summaries.py;
+# it carries breach counts for these SLA presets only
+CUBE_PATH = f"{SUMMARIES_DIR}/cube.parquet"
+CUBE_SLAS = (24, 48, 72)
 
 
 @st.cache_resource
 def get_con():
-        con = duckdb.connect(":memory:")
-        # prefer the partitioned dataset if present (faster scans)
-        base = DATA_PATH_PART if os.path.exists("data/processed_part") else DATA_PATH_SINGLE
-        con.execute(f"""
-                CREATE OR REPLACE VIEW nyc AS
-                SELECT * FROM parquet_scan('{base}');
-        """)
+        try:
+                con = duckdb.connect(DUCKDB_PATH)
+        except duckdb.IOException:
+                # another process holds the file lock; an in-memory database works the same
+                con = duckdb.connect(":memory:")
+        con.execute("PRAGMA enable_object_cache=true")
+        con.execute(f"PRAGMA memory_limit='{DUCKDB_MEMORY_LIMIT}'")
+        # prefer the Hive-partitioned dataset if present: year/month/borough come from the
+        # directory names, so DuckDB prunes whole partitions before reading any footer
+        if os.path.exists("data/processed_part"):
+                con.execute(f"""
+                        CREATE OR REPLACE VIEW nyc AS
+                        SELECT * FROM parquet_scan('{DATA_PATH_PART}', hive_partitioning=1);
+                """)
+        else:
+                # single file has no year column; derive it so _where_clause works unchanged
+                con.execute(f"""
+                        CREATE OR REPLACE VIEW nyc AS
+                        SELECT *, year(created_dt) AS year FROM parquet_scan('{DATA_PATH_SINGLE}');
+                """)
         con.execute("PRAGMA threads=%d" % (os.cpu_count() or 1))
         return con
 
 
-def _where_clause(start_date, end_date, boroughs, complaints):
-        where = ["created_dt >= ?::TIMESTAMP", "created_dt < (?::DATE + INTERVAL 1 DAY)"]
-        params = [pd.to_datetime(start_date), pd.to_datetime(end_date)]
-        if boroughs:
-                where.append("borough IN (" + ",".join(["?"]*len(boroughs)) + ")")
-                params += boroughs
-        if complaints:
-                where.append("complaint_type IN (" + ",".join(["?"]*len(complaints)) + ")")
-                params += complaints
-        return " WHERE " + " AND ".join(where), params
+def _partition_keys(start_date, end_date):
+        """Return the (years, months) partitions that can hold rows in [start_date, end_date]."""
+        # pad by a day either side: partitions are keyed on local time, the range compare is not
+        periods = pd.period_range(pd.to_datetime(start_date) - pd.Timedelta(days=1),
+                                  pd.to_datetime(end_date) + pd.Timedelta(days=1), freq="M")
+        return sorted({p.year for p in periods}), sorted({p.month for p in periods})
 
 
-@st.cache_data(show_spinner=False, ttl=300)
-def kpi_query(start_date, end_date, boroughs, complaints, sla_hours):
-    if USE_DUCKDB:
-        con = get_con()
-        where, params = _where_clause(start_date, end_date, boroughs, complaints)
-        sql = f"""
-            SELECT
-                median(response_hours) AS med_hrs,
-                avg(CASE WHEN response_hours <= ? THEN 1 ELSE 0 END) AS pct_within,
-                count(*)::BIGINT AS tickets
-            FROM nyc
-            {where}
-            AND response_hours IS NOT NULL
-        """
-        return con.execute(sql, [sla_hours, *params]).df().iloc[0]
-    else:
-        # pandas fallback (slower)
-        df_local = pd.read_parquet(DATA_PATH_SINGLE)
-        df_local['created_dt'] = pd.to_datetime(df_local['created_dt'])
-        mask = (df_local['created_dt'] >= pd.to_datetime(start_date)) & (df_local['created_dt'] < (pd.to_datetime(end_date) + pd.Timedelta(days=1)))
-        d = df_local.loc[mask]
-        if boroughs:
-            d = d[d['borough'].isin(boroughs)]
-        if complaints:
-            d = d[d['complaint_type'].isin(complaints)]
-        d = d[d['response_hours'].notna()]
-        return pd.Series({
-            'med_hrs': d['response_hours'].median(),
-            'pct_within': (d['response_hours'] <= sla_hours).mean() if len(d) else float('nan'),
-            'tickets': int(len(d))
-        })
+# Fixed-shape filter: list parameters instead of variable-length IN lists keep the SQL text
+# identical for every selection. DuckDB binds the lists as constants, so an empty selection
+# folds away and year/month/borough still prune partitions.
+WHERE_SQL = """
+        WHERE {t} >= ?::TIMESTAMP AND {t} < (?::DATE + INTERVAL 1 DAY)
+          AND list_contains(?::BIGINT[], year) AND list_contains(?::BIGINT[], month)
+          AND (len(?::VARCHAR[]) = 0 OR list_contains(?::VARCHAR[], borough))
+          AND (len(?::VARCHAR[]) = 0 OR list_contains(?::VARCHAR[], complaint_type))
+"""
+
+
+def _where_clause(start_date, end_date, boroughs, complaints, time_col="created_dt"):
+        years, months = _partition_keys(start_date, end_date)
+        boroughs, complaints = list(boroughs), list(complaints)
+        params = [pd.to_datetime(start_date), pd.to_datetime(end_date), years, months,
+                  boroughs, boroughs, complaints, complaints]
+        return WHERE_SQL.format(t=time_col), params
+
+
+# WHERE text + bound parameters for one filter selection
+FilterCtx = namedtuple("FilterCtx", ["where", "params"])
 
 
 @st.cache_data(show_spinner=False, ttl=300)
-def top_types_query(start_date, end_date, boroughs, complaints, sla_hours, topn):
-    if USE_DUCKDB:
-        con = get_con()
-        where, params = _where_clause(start_date, end_date, boroughs, complaints)
-        sql = f"""
-            SELECT
-                complaint_type,
-                count(*)::BIGINT AS tickets,
-                avg(CASE WHEN response_hours > ? THEN 1 ELSE 0 END) AS breach_rate
-            FROM nyc
-            {where}
-            GROUP BY 1
-            ORDER BY tickets DESC
-            LIMIT {int(topn)}
+def _filter_ctx(start_date, end_date, boroughs, complaints, time_col="created_dt"):
+        """Build the filter once per selection; every query on this rerun reuses it."""
+        where, params = _where_clause(start_date, end_date, boroughs, complaints, time_col)
+        return FilterCtx(where, tuple(params))
+
+
+# how many filtered slices to keep materialized on the shared connection, and the largest
+# slice worth copying; bigger ones (e.g. the default full date range) are read in place, so
+# the copies stay well under DUCKDB_MEMORY_LIMIT
+FILT_TABLES_MAX = 8
+FILT_MAX_ROWS = 2_000_000
+# the columns the aggregates read, with day of week / hour derived once
+FILT_COLS = """
+        complaint_type,
+        isodow(created_dt)::TINYINT AS dow,
+        hour(created_dt)::TINYINT AS hour,
+        response_minutes,
+        response_hours
+"""
+
+
+@st.cache_resource
+def _filt_tables():
+        """LRU of filter tuple -> temp table name (None: too big, read in place), shared across
+        sessions like the connection."""
+        return OrderedDict()
+
+
+@st.cache_resource
+def _filt_lock():
+        """Guards the LRU and the temp tables: hold it from _filtered_table until the query on
+        the returned table is done, so another session can't evict (DROP) it in between."""
+        return threading.RLock()
+
+
+def _data_version():
+        """mtime of the data behind the nyc view; a rebuilt dataset gets fresh temp tables."""
+        path = "data/processed_part" if os.path.exists("data/processed_part") else DATA_PATH_SINGLE
+        try:
+                return os.stat(path).st_mtime_ns
+        except OSError:
+                return 0
+
+
+def _filtered_table(start_date, end_date, boroughs, complaints):
+        """Materialize the filtered slice (only the columns the aggregates use) as a temp table.
+
+        SLA / top-N changes and repeat visits to a filter then aggregate the compact in-memory
+        table instead of decoding Parquet again. Returns None for slices over FILT_MAX_ROWS.
+        Call with _filt_lock() held.
         """
-        return con.execute(sql, [sla_hours, *params]).df()
-    else:
-        df_local = pd.read_parquet(DATA_PATH_SINGLE)
-        df_local['created_dt'] = pd.to_datetime(df_local['created_dt'])
-        mask = (df_local['created_dt'] >= pd.to_datetime(start_date)) & (df_local['created_dt'] < (pd.to_datetime(end_date) + pd.Timedelta(days=1)))
-        d = df_local.loc[mask]
-        if boroughs:
-            d = d[d['borough'].isin(boroughs)]
-        if complaints:
-            d = d[d['complaint_type'].isin(complaints)]
-        d = d[d['response_hours'].notna()]
-        out = d.groupby('complaint_type', observed=True).agg(tickets=('unique_key','count'))
-        out['breach_rate'] = d.groupby('complaint_type', observed=True).apply(lambda s: (s['response_hours'] > sla_hours).mean())
-        out = out.reset_index().sort_values('tickets', ascending=False).head(int(topn))
-        return out
+        key = (str(start_date), str(end_date), tuple(boroughs), tuple(complaints), _data_version())
+        tables = _filt_tables()
+        if key in tables:
+                tables.move_to_end(key)
+                return tables[key]
+        con = get_con()
+        name = "filt_" + hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+        ctx = _filter_ctx(start_date, end_date, boroughs, complaints)
+        # one row past the cap is enough to know the slice is too big to keep
+        con.execute(f"""
+                CREATE OR REPLACE TEMP TABLE {name} AS
+                SELECT {FILT_COLS}
+                FROM nyc
+                {ctx.where}
+                LIMIT {FILT_MAX_ROWS + 1}
+        """, list(ctx.params))
+        if con.execute(f"SELECT count(*) FROM {name}").fetchone()[0] > FILT_MAX_ROWS:
+                con.execute(f"DROP TABLE {name}")
+                name = None
+        tables[key] = name
+        while len(tables) > FILT_TABLES_MAX:
+                _, old = tables.popitem(last=False)
+                if old is not None:
+                        con.execute(f"DROP TABLE IF EXISTS {old}")
+        return name
+
+
+def _filtered_source(start_date, end_date, boroughs, complaints):
+        """(FROM target, params) for the filtered slice: its temp table if one was kept, else a
+        subquery over nyc. Call with _filt_lock() held."""
+        name = _filtered_table(start_date, end_date, boroughs, complaints)
+        if name is not None:
+                return name, []
+        ctx = _filter_ctx(start_date, end_date, boroughs, complaints)
+        return f"(SELECT {FILT_COLS} FROM nyc {ctx.where})", list(ctx.params)
+
+
+DOW_ORDER = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
+
+
+def _filtered_pandas(start_date, end_date, boroughs, complaints):
+    # pandas fallback (slower): read + filter once, shared by every aggregate below
+    df_local = pd.read_parquet(DATA_PATH_SINGLE)
+    df_local['created_dt'] = pd.to_datetime(df_local['created_dt'])
+    mask = (df_local['created_dt'] >= pd.to_datetime(start_date)) & (df_local['created_dt'] < (pd.to_datetime(end_date) + pd.Timedelta(days=1)))
+    d = df_local.loc[mask]
+    if boroughs:
+        d = d[d['borough'].isin(boroughs)]
+    if complaints:
+        d = d[d['complaint_type'].isin(complaints)]
+    d = d[d['response_hours'].notna()].copy()
+    d['hour'] = d['created_dt'].dt.hour
+    d['dow_name'] = pd.Categorical(d['created_dt'].dt.day_name(), categories=DOW_ORDER, ordered=True)
+    return d
+
+
+def _kpi_pandas(d):
+    return pd.Series({
+        'med_hrs': d['response_hours'].median(),
+        'pct_within': 1.0 - d['breach'].mean() if len(d) else float('nan'),
+        'tickets': int(len(d))
+    })
+
+
+def _top_types_pandas(d, topn):
+    out = d.groupby('complaint_type', observed=True).agg(tickets=('unique_key','count'), breach_rate=('breach','mean'))
+    out = out.reset_index().sort_values('tickets', ascending=False).head(int(topn))
+    return out
+
+
+def _seasonality_pandas(d):
+    out = d.groupby(['dow_name','hour'], observed=True).agg(tickets=('unique_key','count'), breach_rate=('breach','mean'), median_response=('response_hours','median')).reset_index()
+    return out
+
+
+def _dow_agg_pandas(d):
+    out = d.groupby('dow_name', observed=True).agg(median_response=('response_hours','median'), breach_rate=('breach','mean'), tickets=('unique_key','count')).reset_index()
+    return out
 
 
 @st.cache_data(show_spinner=False, ttl=300)
-def seasonality_query(start_date, end_date, boroughs, complaints, sla_hours):
-    if USE_DUCKDB:
-        con = get_con()
-        where, params = _where_clause(start_date, end_date, boroughs, complaints)
-        sql = f"""
-            SELECT
-                strftime(created_dt, '%A') AS dow_name,
-                extract(hour from created_dt)::INT AS hour,
-                count(*)::BIGINT AS tickets,
-                avg(CASE WHEN response_hours > ? THEN 1 ELSE 0 END) AS breach_rate,
-                median(response_hours) AS median_response
-            FROM nyc
-            {where}
-            AND response_hours IS NOT NULL
-            GROUP BY 1,2
-        """
-        return con.execute(sql, [sla_hours, *params]).df()
-    else:
-        df_local = pd.read_parquet(DATA_PATH_SINGLE)
-        df_local['created_dt'] = pd.to_datetime(df_local['created_dt'])
-        mask = (df_local['created_dt'] >= pd.to_datetime(start_date)) & (df_local['created_dt'] < (pd.to_datetime(end_date) + pd.Timedelta(days=1)))
-        d = df_local.loc[mask]
-        if boroughs:
-            d = d[d['borough'].isin(boroughs)]
-        if complaints:
-            d = d[d['complaint_type'].isin(complaints)]
-        d = d[d['response_hours'].notna()]
-        d['hour'] = d['created_dt'].dt.hour
-        d['dow_name'] = pd.Categorical(d['created_dt'].dt.day_name(), categories=["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"], ordered=True)
-        out = d.groupby(['dow_name','hour'], observed=True).agg(tickets=('unique_key','count'), breach_rate=('response_hours', lambda s: (s > sla_hours).mean()), median_response=('response_hours','median')).reset_index()
-        return out
+def all_aggregates_query(start_date, end_date, boroughs, complaints, sla_hours, topn):
+    """Return {'kpi','top_types','seasonality','dow'} for the current filters from a single scan.
+
+    One GROUPING SETS query over the materialized filter slice replaces four separate queries
+    that each re-read and re-decoded the same Parquet columns; the `grp` bitmask tells the
+    grouping sets apart. For the preset SLAs the precomputed cube is used instead of raw rows.
+    Medians don't depend on the SLA and come from _medians_query on both paths.
+    """
+    if USE_DUCKDB and sla_hours in CUBE_SLAS and os.path.exists(CUBE_PATH):
+        return _cube_aggregates(start_date, end_date, boroughs, complaints, sla_hours, topn)
+    if not USE_DUCKDB:
+        d = _filtered_pandas(start_date, end_date, boroughs, complaints)
+        # breach flag computed once so every groupby uses pandas' C mean, not a per-group lambda
+        d = d.assign(breach=(d['response_hours'] > sla_hours).astype('int8'))
+        return {
+            'kpi': _kpi_pandas(d),
+            'top_types': _top_types_pandas(d, topn),
+            'seasonality': _seasonality_pandas(d),
+            'dow': _dow_agg_pandas(d),
+        }
+    con = get_con()
+    sql = """
+        SELECT
+            GROUPING(complaint_type, dow, hour) AS grp,
+            complaint_type, dow, hour,
+            count(*)::BIGINT AS all_tickets,
+            count(response_minutes)::BIGINT AS tickets,
+            round(avg(CASE WHEN response_minutes > ? * 60 THEN 1 ELSE 0 END), 4) AS all_breach_rate,
+            round(avg(CASE WHEN response_minutes > ? * 60 THEN 1 ELSE 0 END) FILTER (WHERE response_minutes IS NOT NULL), 4) AS breach_rate
+        FROM {filt}
+        GROUP BY GROUPING SETS ((), (complaint_type), (dow, hour), (dow))
+    """
+    with _filt_lock():
+        filt, params = _filtered_source(start_date, end_date, boroughs, complaints)
+        res = con.execute(sql.format(filt=filt), [sla_hours, sla_hours, *params]).df()
+    return _split_aggregates(res, _medians_query(start_date, end_date, boroughs, complaints), topn)
 
 
 @st.cache_data(show_spinner=False, ttl=300)
-def dow_agg_query(start_date, end_date, boroughs, complaints, sla_hours):
-    """Return per-day-of-week aggregates directly from DuckDB to avoid pandas groupby on large tables."""
-    if USE_DUCKDB:
-        con = get_con()
-        where, params = _where_clause(start_date, end_date, boroughs, complaints)
-        sql = f"""
+def _medians_query(start_date, end_date, boroughs, complaints):
+    """Overall, per day/hour and per day medians of response_hours for the current filters.
+
+    Kept out of the SLA-keyed aggregates so moving the SLA slider doesn't recompute them. When
+    the cube exists both paths take them from it, so preset and custom SLAs show the same
+    medians; otherwise they are approx_quantile (t-digest) over the filtered rows.
+    """
+    if os.path.exists(CUBE_PATH):
+        return _cube_medians(start_date, end_date, boroughs, complaints)
+    with _filt_lock():
+        filt, params = _filtered_source(start_date, end_date, boroughs, complaints)
+        return get_con().execute(f"""
             SELECT
-                strftime(created_dt, '%A') AS dow_name,
-                median(response_hours) AS median_response,
-                avg(CASE WHEN response_hours > ? THEN 1 ELSE 0 END) AS breach_rate,
-                count(*)::BIGINT AS tickets
-            FROM nyc
-            {where}
-            AND response_hours IS NOT NULL
-            GROUP BY 1
-        """
-        return con.execute(sql, [sla_hours, *params]).df()
-    else:
-        df_local = pd.read_parquet(DATA_PATH_SINGLE)
-        df_local['created_dt'] = pd.to_datetime(df_local['created_dt'])
-        mask = (df_local['created_dt'] >= pd.to_datetime(start_date)) & (df_local['created_dt'] < (pd.to_datetime(end_date) + pd.Timedelta(days=1)))
-        d = df_local.loc[mask]
-        if boroughs:
-            d = d[d['borough'].isin(boroughs)]
-        if complaints:
-            d = d[d['complaint_type'].isin(complaints)]
-        d = d[d['response_hours'].notna()]
-        d['dow_name'] = pd.Categorical(d['created_dt'].dt.day_name(), categories=["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"], ordered=True)
-        out = d.groupby('dow_name', observed=True).agg(median_response=('response_hours','median'), breach_rate=('response_hours', lambda s: (s > sla_hours).mean()), tickets=('unique_key','count')).reset_index()
-        return out
+                GROUPING(dow, hour) AS mgrp,
+                dow, hour,
+                round(approx_quantile(response_hours, 0.5), 2) AS median_response
+            FROM {filt}
+            GROUP BY GROUPING SETS ((), (dow, hour), (dow))
+        """, params).df()
+
+
+def _cube_medians(start_date, end_date, boroughs, complaints):
+    """_medians_query's frame from the cube alone: the resolved-weighted median of the
+    selected cells' medians. Cell medians can't be combined exactly, so this approximates
+    the median of the underlying rows without reading them.
+    """
+    ctx = _filter_ctx(start_date, end_date, boroughs, complaints, time_col="date")
+    sql = f"""
+        WITH cells AS (
+            SELECT GROUPING(dow, hour) AS mgrp, dow, hour, median_response AS m, sum(resolved) AS n
+            FROM parquet_scan('{CUBE_PATH}/**/*.parquet', hive_partitioning=1)
+            {ctx.where}
+              AND resolved > 0
+            GROUP BY GROUPING SETS ((m), (dow, hour, m), (dow, m))
+        ), ranked AS (
+            SELECT mgrp, dow, hour, m,
+                   sum(n) OVER (PARTITION BY mgrp, dow, hour ORDER BY m) AS cum,
+                   sum(n) OVER (PARTITION BY mgrp, dow, hour) AS total
+            FROM cells
+        )
+        SELECT mgrp, dow, hour, round(min(m) FILTER (WHERE 2 * cum >= total), 2) AS median_response
+        FROM ranked
+        GROUP BY mgrp, dow, hour
+    """
+    return get_con().execute(sql, list(ctx.params)).df()
+
+
+def _cube_aggregates(start_date, end_date, boroughs, complaints, sla_hours, topn):
+    """Same result as all_aggregates_query, rolled up from the precomputed cube; the raw
+    rows are never read (medians come from the cube's cells too, see _cube_medians).
+    """
+    con = get_con()
+    ctx = _filter_ctx(start_date, end_date, boroughs, complaints, time_col="date")
+    sql = f"""
+        SELECT
+            GROUPING(complaint_type, dow, hour) AS grp,
+            complaint_type, dow, hour,
+            -- sums over no rows are NULL; an empty selection should read as 0 tickets
+            coalesce(sum(tickets), 0)::BIGINT AS all_tickets,
+            coalesce(sum(resolved), 0)::BIGINT AS tickets,
+            round(sum(breach_cnt_{int(sla_hours)})::DOUBLE / nullif(sum(tickets), 0), 4) AS all_breach_rate,
+            round(sum(breach_cnt_{int(sla_hours)})::DOUBLE / nullif(sum(resolved), 0), 4) AS breach_rate
+        FROM parquet_scan('{CUBE_PATH}/**/*.parquet', hive_partitioning=1)
+        {ctx.where}
+        GROUP BY GROUPING SETS ((), (complaint_type), (dow, hour), (dow))
+    """
+    res = con.execute(sql, list(ctx.params)).df()
+    return _split_aggregates(res, _medians_query(start_date, end_date, boroughs, complaints), topn)
+
+
+def _split_aggregates(res, med, topn):
+    """Slice a GROUPING SETS result (plus the _medians_query frame) into the four page frames."""
+    # grp bits are (complaint_type, dow, hour); mgrp bits are (dow, hour); set = "rolled up"
+    res = res.merge(med.loc[med['mgrp'] == 0b00, ['dow','hour','median_response']], how='left', on=['dow','hour'])
+    day_med = med.loc[med['mgrp'] == 0b01].set_index('dow')['median_response']
+    # an empty selection has no cells to take a median of
+    all_med = med.loc[med['mgrp'] == 0b11, 'median_response']
+    res.loc[res['grp'] == 0b101, 'median_response'] = res['dow'].map(day_med)
+    # dow is ISO (1=Monday); names are only attached to the small aggregated result
+    res['dow_name'] = res['dow'].map(dict(enumerate(DOW_ORDER, start=1)))
+    kpi_row = res[res['grp'] == 0b111].iloc[0]
+    # top types count every ticket, including ones still open
+    top_types = (
+        res.loc[res['grp'] == 0b011, ['complaint_type','all_tickets','all_breach_rate']]
+        .rename(columns={'all_tickets': 'tickets', 'all_breach_rate': 'breach_rate'})
+        .sort_values('tickets', ascending=False).head(int(topn))
+    )
+    # seasonality/day aggregates (like the KPIs) only count tickets with a response time
+    season = res[(res['grp'] == 0b100) & (res['tickets'] > 0)]
+    dow = res[(res['grp'] == 0b101) & (res['tickets'] > 0)]
+    return {
+        'kpi': pd.Series({
+            'med_hrs': all_med.iloc[0] if len(all_med) else float('nan'),
+            'pct_within': 1.0 - kpi_row['breach_rate'],
+            'tickets': int(kpi_row['tickets']),
+        }),
+        'top_types': top_types.reset_index(drop=True),
+        'seasonality': season[['dow_name','hour','tickets','breach_rate','median_response']].reset_index(drop=True),
+        'dow': dow[['dow_name','median_response','breach_rate','tickets']].reset_index(drop=True),
+    }
 
 # ---------- page & theme ----------
 st.set_page_config(page_title="NYC 311 Response Time & SLA Risk", layout="wide")
@@ -226,8 +413,29 @@ hr{ margin: 12px 0 4px 0; border: none; height: 1px; background: var(--border);
 """, unsafe_allow_html=True)
 
 # ---------- data ----------
+def _precomputed_metadata():
+    """Metadata from the tiny files written by scripts/precompute_summaries.py, or None."""
+    try:
+        b = pd.read_parquet(f"{SUMMARIES_DIR}/boroughs.parquet")
+        c = pd.read_parquet(f"{SUMMARIES_DIR}/complaints.parquet")
+    except Exception:
+        return None
+    return {
+        'min_date': min(b['min_date'].min(), c['min_date'].min()),
+        'max_date': max(b['max_date'].max(), c['max_date'].max()),
+        'boroughs': sorted(b['borough'].tolist()),
+        'complaints': sorted(c['complaint_type'].tolist()),
+    }
+
+
 @st.cache_data
 def load_metadata():
+    # prefer the precomputed distinct values: O(1) instead of scanning the dataset
+    md = _precomputed_metadata()
+    if md is not None:
+        md['min_date'] = pd.to_datetime(md['min_date']).date()
+        md['max_date'] = pd.to_datetime(md['max_date']).date()
+        return md
     # use DuckDB to fetch min/max dates and distinct boroughs/complaint types (fast, no full table read)
     con = get_con()
     md = {}
@@ -280,59 +488,90 @@ with st.sidebar:
 
 # ---------- filtering ----------
 start_date, end_date = dr
-# Use DuckDB cached queries to compute KPIs and small aggregations
-kpi = kpi_query(start_date, end_date, sel_b, sel_c, sla_hours)
+# Use one cached DuckDB scan to compute KPIs and the small chart aggregations
+aggs = all_aggregates_query(start_date, end_date, sel_b, sel_c, sla_hours, topn)
+kpi = aggs["kpi"]
 med_resp = kpi["med_hrs"]
 pct_within = kpi["pct_within"]
 total_tickets = kpi["tickets"]
 
 # We'll still construct a small dataframe for the data sample/download grid using a lightweight DuckDB query
-def _sample_df(start_date, end_date, boroughs, complaints, limit=20000):
+DEFAULT_SAMPLE_COLS = [
+    "unique_key","created_dt","borough","complaint_type","descriptor",
+    "response_hours","within_sla","hour","dow_name","month_name"
+]
+
+
+@st.cache_data(show_spinner=False)
+def nyc_columns():
+    # schema only; DuckDB reads it from the Parquet footer
+    return [r[0] for r in get_con().execute("DESCRIBE nyc").fetchall()]
+
+
+@st.cache_data(show_spinner=False, ttl=300)
+def _sample_df(start_date, end_date, boroughs, complaints, cols, sla_hours, limit=20000):
+    # project only the columns the grid shows so DuckDB decodes just those Parquet columns
+    # instead of SELECT *; the SLA flags for the current threshold are computed in the query
     con = get_con()
-    where, params = _where_clause(start_date, end_date, boroughs, complaints)
-    sql = f"SELECT * FROM nyc {where} LIMIT {int(limit)}"
-    return con.execute(sql, params).df()
+    ctx = _filter_ctx(start_date, end_date, boroughs, complaints)
+    available = set(nyc_columns()) - {"within_sla", "breach"}
+    select = [f'"{c}"' for c in cols if c in available] + [
+        "coalesce(response_hours <= ?, false) AS within_sla",
+        "NOT coalesce(response_hours <= ?, false) AS breach",
+    ]
+    sql = f"SELECT {','.join(select)} FROM nyc {ctx.where} LIMIT {int(limit)}"
+    return con.execute(sql, [sla_hours, sla_hours, *ctx.params]).df()
 
 
 def _load_precomputed():
-    """Return dict of precomputed DataFrames if they exist, else empty dict."""
+    """Return {name: pyarrow Dataset} for the summary files that exist (opened lazily, not read)."""
     out = {}
     p = SUMMARIES_DIR
     try:
-        import os
         if os.path.exists(p):
-            import pandas as pd
-            def _r(fn):
+            for key, fn in [('daily', 'daily_summary.parquet'),
+                            ('complaint_type', 'complaint_type_summary.parquet')]:
                 fp = f"{p}/{fn}"
                 try:
-                    return pd.read_parquet(fp)
+                    out[key] = pa_ds.dataset(fp, format="parquet")
                 except Exception:
-                    return None
-            out['daily'] = _r('daily_summary.parquet')
-            out['complaint_type'] = _r('complaint_type_summary.parquet')
-            out['dow_hour'] = _r('dow_hour_summary.parquet')
+                    pass
     except Exception:
         return {}
-    return {k:v for k,v in out.items() if v is not None}
+    return out
+
+
+@st.cache_data(show_spinner=False, ttl=300)
+def _read_summary(name, boroughs, complaints, columns):
+    """Read one summary with the borough/complaint filter and column projection pushed into the scan."""
+    expr = None
+    if boroughs:
+        expr = pa_ds.field('borough').isin(list(boroughs))
+    if complaints:
+        c = pa_ds.field('complaint_type').isin(list(complaints))
+        expr = c if expr is None else expr & c
+    return PRECOMPUTED[name].to_table(columns=list(columns), filter=expr).to_pandas()
 
 # load precomputed summaries once
 PRECOMPUTED = _load_precomputed()
 
-dff = _sample_df(start_date, end_date, sel_b, sel_c, limit=1200)
-dff["within_sla"] = dff["response_hours"].le(sla_hours)
-dff["breach"] = ~dff["within_sla"]
-closed = dff["response_hours"].notna()
+# the grid's column picker is rendered further down; its last selection drives the projection
+sample_cols = st.session_state.get("sample_cols", DEFAULT_SAMPLE_COLS)
+dff = _sample_df(start_date, end_date, sel_b, sel_c, tuple(sample_cols), sla_hours, limit=1200)
 
 # ---------- header ----------
 st.title("NYC 311 Response Time & SLA Risk")
 
 # Dev indicator: small badge only when APP_ENV=dev (keeps UI calm by default)
-import os, hashlib
-sha = None
-try:
-    sha = hashlib.sha1(open(__file__, "rb").read()).hexdigest()[:8]
-except Exception:
-    sha = "unknown"
+@st.cache_resource
+def _build_sha():
+    # hashed once per process; the source doesn't change under a running server
+    try:
+        return hashlib.sha1(open(__file__, "rb").read()).hexdigest()[:8]
+    except Exception:
+        return "unknown"
+
+sha = _build_sha()
 
 app_env = os.getenv("APP_ENV", "prod").lower()
 
@@ -367,15 +606,12 @@ st.subheader("Breach rate by Complaint Type")
 
 if 'complaint_type' in PRECOMPUTED:
     # filter precomputed complaint_type summary down to current boroughs/complaints
-    by_type = PRECOMPUTED['complaint_type']
-    if sel_b:
-        by_type = by_type[by_type['borough'].isin(sel_b)]
-    if sel_c:
-        by_type = by_type[by_type['complaint_type'].isin(sel_c)]
+    by_type = _read_summary('complaint_type', sel_b, sel_c, ('complaint_type','tickets','breach_rate'))
     # order and limit
     by_type = by_type.sort_values('tickets', ascending=False).head(int(topn))
+    by_type = by_type.round({'breach_rate': 4})
 else:
-    by_type = top_types_query(start_date, end_date, sel_b, sel_c, sla_hours, topn)
+    by_type = aggs["top_types"]
 
 if by_type.empty:
     st.info("No data for current filters (try expanding date range or lowering SLA).")
@@ -417,16 +653,8 @@ else:
 
 st.subheader("Seasonality")
 
-if 'dow_hour' in PRECOMPUTED:
-    season = PRECOMPUTED['dow_hour']
-    if sel_b:
-        season = season[season['borough'].isin(sel_b)]
-    if sel_c:
-        season = season[season['complaint_type'].isin(sel_c)]
-    # ensure types match expected
-    season = season.rename(columns={'median_response':'median_response','breach_rate':'breach_rate'})
-else:
-    season = seasonality_query(start_date, end_date, sel_b, sel_c, sla_hours)
+# day x hour cells from the same aggregates as the KPIs (cube or raw rows)
+season = aggs["seasonality"]
 
 if season.empty:
     st.info("No seasonality data for current filters.")
@@ -449,8 +677,8 @@ else:
     st.markdown("**Breach rate by Day & Hour**")
     st.altair_chart(heat, use_container_width=True)
 
-    # Aggregate per day for lines (pull directly from DuckDB)
-    dow = dow_agg_query(start_date, end_date, sel_b, sel_c, sla_hours)
+    # Aggregate per day for lines (from the same DuckDB scan)
+    dow = aggs["dow"]
     # convert breach_rate -> pct_within for the UI
     dow["pct_within"] = 1.0 - dow["breach_rate"].astype(float)
 
@@ -476,13 +704,14 @@ else:
 with st.container():
     st.markdown('<div class="section-card">', unsafe_allow_html=True)
     st.markdown('<div class="section-title">Data sample</div>', unsafe_allow_html=True)
-    default_cols = [
-        "unique_key","created_dt","borough","complaint_type","descriptor",
-        "response_hours","within_sla","hour","dow_name","month_name"
-    ]
-    show_cols = st.multiselect("Columns to show", options=list(dff.columns), default=default_cols)
+    # picking extra columns reruns the script and re-issues the sample query with them
+    col_options = list(dict.fromkeys([*nyc_columns(), "within_sla", "breach"]))
+    show_cols = st.multiselect("Columns to show", options=col_options, default=DEFAULT_SAMPLE_COLS, key="sample_cols")
     st.dataframe(dff[show_cols].head(1200), use_container_width=True)
-    csv = dff[show_cols].to_csv(index=False).encode("utf-8")
+    # Arrow's CSV writer emits UTF-8 bytes directly (no intermediate Python str)
+    buf = io.BytesIO()
+    pa_csv.write_csv(pa.Table.from_pandas(dff[show_cols], preserve_index=False), buf)
+    csv = buf.getvalue()
     st.download_button("Download current view (CSV)", csv, file_name="nyc311_current_view.csv", mime="text/csv")
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -3,14 +3,16 @@ from pathlib import Path
 from datetime import datetime
 
 clean_path = Path("data/processed/nyc311_clean.parquet")
-df = pd.read_parquet(clean_path)
+# only the columns the two summaries use
+df = pd.read_parquet(clean_path, columns=["unique_key","created_dt","borough","complaint_type",
+                                          "response_hours","within_sla"])
 df["created_dt"] = pd.to_datetime(df["created_dt"])
 df["date"] = df["created_dt"].dt.date
 
 # daily x borough summary
 daily_boro = (
     df.dropna(subset=["response_hours"])
-      .groupby(["date","borough"], dropna=False)
+      .groupby(["date","borough"], dropna=False, observed=True)
       .agg(
           tickets=("unique_key","count"),
           median_response=("response_hours","median"),
@@ -24,7 +26,7 @@ daily_boro["pct_within_sla"] = (daily_boro["pct_within_sla"]*100).round(2)
 ctype = (
     df.dropna(subset=["response_hours"])
       .assign(breach=lambda x: ~x["within_sla"])
-      .groupby(["complaint_type"], dropna=False)
+      .groupby(["complaint_type"], dropna=False, observed=True)
       .agg(tickets=("unique_key","count"), breaches=("breach","sum"))
       .assign(breach_rate=lambda x: (x["breaches"]/x["tickets"]*100).round(2))
       .reset_index()
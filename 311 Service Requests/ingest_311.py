@@ -169,7 +169,8 @@ def main():
         # standardize dtypes now; safer for parquet & later processing
         for c in ["created_date", "closed_date", "resolution_action_updated_date"]:
             if c in df.columns:
-                df[c] = pd.to_datetime(df[c], errors="coerce")
+                # Socrata sends ISO 8601 floating timestamps; a pinned format skips per-row inference
+                df[c] = pd.to_datetime(df[c], errors="coerce", format="ISO8601", cache=True)
         for c in ["latitude", "longitude"]:
             if c in df.columns:
                 df[c] = pd.to_numeric(df[c], errors="coerce")
@@ -1,9 +1,15 @@
 # process_311.py
 import pandas as pd
 from pathlib import Path
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import os
+import shutil
 import warnings
 
 try:
@@ -15,74 +21,154 @@ except Exception:  # pragma: no cover - environment-dependent
     warnings.warn("python-holidays not installed; 'is_holiday' will be all False."
                   "Install the 'holidays' package to enable holiday detection.")
 
+try:
+    from numba import njit, prange
+    _NUMBA_AVAILABLE = True
+except Exception:  # pragma: no cover - optional speedup
+    _NUMBA_AVAILABLE = False
+
 SLA_HOURS = float(os.getenv("SLA_HOURS", "24"))
+_NY = ZoneInfo("America/New_York")
+# rows per parquet row group: large enough for good ZSTD ratios, small enough that the
+# created_dt min/max stats stay selective
+ROW_GROUP_SIZE = 256_000
+# ZSTD level for both writes; 3 is zstd's default speed/ratio balance
+ZSTD_LEVEL = 3
+# name lookups indexed by day_of_week (0=Mon) and month (1-12)
+_DOW_NAMES = np.array(["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"])
+_MONTH_NAMES = np.array(["", "January","February","March","April","May","June",
+                         "July","August","September","October","November","December"])
+
+
+# below this many rows the numpy path is as fast as the JIT'd kernel (and skips compiling it)
+NUMBA_MIN_ROWS = 1_000_000
+# datetime64[D] counts days from 1970-01-01; adding this gives date.toordinal() values
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=4)
+def _ny_holidays(years):
+    """Ordinals of NY holidays for a tuple of years (built once per process)."""
+    return frozenset(d.toordinal() for d in US(state='NY', years=list(years)))
+
+if _NUMBA_AVAILABLE:
+    _NAT = np.iinfo(np.int64).min
+
+    @njit(parallel=True, cache=True)
+    def _response_kernel(closed, resolved, created, sla_hours, out_hours, out_within):
+        # fused coalesce + subtract + SLA compare over int64 ns arrays, one pass, no temporaries
+        for i in prange(closed.size):
+            end = resolved[i] if closed[i] == _NAT else closed[i]
+            if end == _NAT:
+                out_hours[i] = np.nan
+                out_within[i] = False
+            else:
+                h = (end - created[i]) / 3.6e12
+                out_hours[i] = h
+                out_within[i] = h <= sla_hours
 
 def load_raw():
     files = sorted(Path("data/raw").glob("nyc311_*.parquet"))
     if not files:
         raise SystemExit("No raw parquet files found in data/raw/. Run ingest_311.py first.")
-    df = pd.concat((pd.read_parquet(f) for f in files), ignore_index=True)
-    return df
+    # read each page as an Arrow table (threaded decode) and chain the chunks without copying.
+    # Page files can disagree on types (an all-null column is written as null, ints vs floats),
+    # so let concat_tables promote them; dropping the pandas metadata gives a fresh RangeIndex
+    tables = [pq.read_table(f, use_threads=True) for f in files]
+    table = pa.concat_tables(tables, promote_options="permissive").replace_schema_metadata(None)
+    del tables
+    # strings stay Arrow-backed; timestamps/numbers keep numpy dtypes for the datetime math
+    arrow_str = pd.ArrowDtype(pa.string())
+    return table.to_pandas(self_destruct=True, split_blocks=True,
+                           types_mapper={pa.string(): arrow_str, pa.large_string(): arrow_str}.get)
 
 def engineer(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-
     # unify timestamps (assume Eastern local timestamps as provided by NYC Open Data)
-    # ensure created_date exists
-    df = df[~df["created_date"].isna()].copy()
+    # ensure created_date exists; the boolean take is already a new frame, no extra copy
+    df = df.loc[df["created_date"].notna()]
 
     # choose response_end = closed_date else resolution_action_updated_date
     # (Some tickets never close; we exclude rows with no end when computing response_hours)
-    response_end = df["closed_date"].fillna(df["resolution_action_updated_date"])
-    df["response_hours"] = (response_end - df["created_date"]).dt.total_seconds()/3600.0
-    df.loc[response_end.isna(), "response_hours"] = np.nan
-
-    # SLA
-    df["within_sla"] = df["response_hours"].le(SLA_HOURS)
+    # done on the raw datetime64[ns] arrays: one where + one int64 subtraction, no temp Series
+    closed = df["closed_date"].to_numpy(dtype="datetime64[ns]")
+    resolved = df["resolution_action_updated_date"].to_numpy(dtype="datetime64[ns]")
+    created = df["created_date"].to_numpy(dtype="datetime64[ns]")
+    if _NUMBA_AVAILABLE and len(df) >= NUMBA_MIN_ROWS:
+        # large frames: response_hours and the SLA flag in one fused parallel pass
+        response_hours = np.empty(len(df), dtype="float64")
+        within_sla = np.empty(len(df), dtype=bool)
+        _response_kernel(closed.view("i8"), resolved.view("i8"), created.view("i8"),
+                         SLA_HOURS, response_hours, within_sla)
+    else:
+        response_end = np.where(np.isnat(closed), resolved, closed)
+        response_hours = (response_end.view("i8") - created.view("i8")) / 3.6e12
+        # NaT is an int64 sentinel, so its "delta" is garbage; mask it back to NaN
+        response_hours[np.isnat(response_end)] = np.nan
+        # SLA: plain ndarray compare; NaN (no response yet) compares False, same as .le() did
+        within_sla = response_hours <= SLA_HOURS
+    df["response_hours"] = response_hours
+    # 2-byte copy for the dashboard's SLA comparisons: whole minutes, capped at 65535 (~45 days),
+    # so medians must still come from response_hours
+    df["response_minutes"] = (df["response_hours"] * 60).round().clip(0, 65535).astype("UInt16")
+    df["within_sla"] = within_sla
 
     # time features
     # parse timestamps as UTC if timezone-naive, then convert to America/New_York
-    import pytz
-    tz = pytz.timezone("America/New_York")
-    df["created_dt"] = pd.to_datetime(df["created_date"])
+    created = df["created_date"]
+    # parquet pages already hold datetimes; only parse when the column arrived as text
+    if not pd.api.types.is_datetime64_any_dtype(created):
+        created = pd.to_datetime(created, utc=True, cache=True, format="ISO8601", errors="coerce")
     # if timezone-naive, treat as UTC then convert; otherwise keep tz-aware and convert to NY
-    if df["created_dt"].dt.tz is None:
-        df["created_dt"] = df["created_dt"].dt.tz_localize('UTC').dt.tz_convert(tz)
-    else:
-        df["created_dt"] = df["created_dt"].dt.tz_convert(tz)
+    if created.dt.tz is None:
+        created = created.dt.tz_localize('UTC')
+    df["created_dt"] = created.dt.tz_convert(_NY)
     df["date"] = df["created_dt"].dt.date
-    df["hour"] = df["created_dt"].dt.hour
-    df["day_of_week"] = df["created_dt"].dt.day_of_week   # 0=Mon
-    df["dow_name"] = df["created_dt"].dt.day_name()
-    df["month"] = df["created_dt"].dt.month
-    df["month_name"] = df["created_dt"].dt.month_name()
+    # Arrow kernels on the tz-aware timestamps give NY-local fields; names are array lookups.
+    # int8 is plenty for these and is 1/8 the bytes of the kernels' int64 on disk and in RAM
+    ts = pa.array(df["created_dt"])
+    df["hour"] = pc.hour(ts).cast(pa.int8()).to_numpy()
+    df["day_of_week"] = pc.day_of_week(ts).cast(pa.int8()).to_numpy()   # 0=Mon
+    df["dow_name"] = _DOW_NAMES[df["day_of_week"].to_numpy()]
+    df["month"] = pc.month(ts).cast(pa.int8()).to_numpy()
+    df["month_name"] = _MONTH_NAMES[df["month"].to_numpy()]
 
     # holidays (NY) — if the holidays package isn't available, default to False
     if _HOLIDAYS_AVAILABLE:
-        ny_holidays = US(state='NY', years=sorted(df["created_dt"].dt.year.unique()))
-        df["is_holiday"] = df["created_dt"].dt.date.map(lambda d: d in ny_holidays)
+        years = tuple(int(y) for y in sorted(df["created_dt"].dt.year.unique()))
+        holidays = np.fromiter(_ny_holidays(years), dtype="int64")
+        # local (NY) calendar day; .values on the tz-aware column would give the UTC day
+        created_day = df["created_dt"].dt.tz_localize(None).to_numpy().astype("datetime64[D]")
+        df["is_holiday"] = np.isin(created_day.astype("int64") + _EPOCH_ORDINAL, holidays)
     else:
         df["is_holiday"] = False
 
-    # small cleanups
+    # small cleanups: trim with Arrow's C++ kernel into Arrow-backed string columns
     for c in ["borough","complaint_type","descriptor","status","agency","open_data_channel_type","city","incident_zip"]:
         if c in df.columns:
-            df[c] = df[c].astype("string").str.strip()
+            arr = pa.array(df[c], from_pandas=True).cast(pa.string())
+            df[c] = pd.Series(pd.arrays.ArrowExtensionArray(pc.utf8_trim_whitespace(arr)), index=df.index)
 
     # normalize and fill city where missing: prefer borough when city is missing, then 'Unknown'
     if 'city' in df.columns:
+        city = pa.array(df['city'])
         # if borough exists, use it as a fallback for missing city
         if 'borough' in df.columns:
-            df['city'] = df['city'].fillna(df['borough'])
-        # normalize casing to title-case and strip
-        df['city'] = df['city'].str.title().str.strip()
-        df['city'] = df['city'].fillna('Unknown')
+            city = pc.fill_null(city, pa.array(df['borough']))
+        # one Arrow pipeline: fill, strip, then title-case
+        city = pc.utf8_title(pc.utf8_trim_whitespace(pc.fill_null(city, 'Unknown')))
+        df['city'] = pd.Series(pd.arrays.ArrowExtensionArray(city), index=df.index)
+
+    # low-cardinality filter/group-by keys: categoricals are written as Parquet dictionary
+    # columns, so readers compare small integer codes instead of decoding strings
+    for c in ["borough","complaint_type"]:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
 
     # save compact selection for app/analytics
     keep = [
         "unique_key","created_dt","date","hour","day_of_week","dow_name","month","month_name","is_holiday",
         "borough","complaint_type","descriptor","agency","status","open_data_channel_type",
-        "response_hours","within_sla","latitude","longitude","incident_zip","city"
+        "response_hours","response_minutes","within_sla","latitude","longitude","incident_zip","city"
     ]
     keep = [c for c in keep if c in df.columns]
     return df[keep]
@@ -100,19 +186,38 @@ def main():
     assert clean["unique_key"].is_unique, "unique_key has duplicates"
     # quick row sanity
     assert clean["response_hours"].dropna().ge(0).all(), "negative response_hours found"
+    # sort by time (then borough) so each row group covers a narrow created_dt range;
+    # tight min/max stats let DuckDB skip row groups outside the dashboard's date filter
+    clean = clean.sort_values(["created_dt","borough"], ignore_index=True)
     Path("data/processed").mkdir(parents=True, exist_ok=True)
     clean_path = Path("data/processed/nyc311_clean.parquet")
-    clean.to_parquet(clean_path, index=False)
+    clean.to_parquet(clean_path, index=False, row_group_size=ROW_GROUP_SIZE, compression="zstd",
+                     compression_level=ZSTD_LEVEL)
     print(f"Saved clean dataset → {clean_path} ({len(clean):,} rows)")
-    # also write a partitioned dataset for fast filtering
+    # also write a Hive-partitioned dataset (year=YYYY/month=M/borough=X/) so DuckDB
+    # can prune whole directories for date/borough filters before opening any footer.
+    # Start from an empty directory: stale files (e.g. an older YYYY/M/ layout) would make
+    # hive_partitioning scans fail or double-count
+    part_dir = Path("data/processed_part")
+    shutil.rmtree(part_dir, ignore_errors=True)
     try:
-        import pyarrow as pa, pyarrow.dataset as ds
-        clean["year"] = clean["created_dt"].dt.year
-        clean["month"] = clean["created_dt"].dt.month
+        import pyarrow.dataset as ds
+        # engineer already wrote the NY-local month; only year is added, by an Arrow kernel on
+        # the tz-aware column, so the pandas frame is left untouched
         table = pa.Table.from_pandas(clean, preserve_index=False)
+        table = table.append_column("year", pc.year(table["created_dt"]))
+        # a null key would land in borough=__HIVE_DEFAULT_PARTITION__, which hive readers
+        # (duckdb 1.1) return as that literal string; file them under NYC's own 'Unspecified'
+        i = table.schema.get_field_index("borough")
+        table = table.set_column(i, "borough", pc.fill_null(table["borough"].cast(pa.string()), "Unspecified"))
         ds.write_dataset(
-            table, base_dir="data/processed_part/",
-            format="parquet", partitioning=["year","month"], existing_data_behavior="overwrite_or_ignore"
+            table, base_dir=str(part_dir),
+            format="parquet", partitioning=["year","month","borough"], partitioning_flavor="hive",
+            file_options=ds.ParquetFileFormat().make_write_options(compression="zstd", compression_level=ZSTD_LEVEL),
+            # the writer flushes each ~32K-row input batch as its own group unless told to buffer
+            min_rows_per_group=ROW_GROUP_SIZE, max_rows_per_group=ROW_GROUP_SIZE,
+            max_rows_per_file=2_000_000, use_threads=True,
+            existing_data_behavior="overwrite_or_ignore"
         )
         print("Wrote partitioned dataset → data/processed_part/")
     except Exception as e:  # pragma: no cover - optional dependency
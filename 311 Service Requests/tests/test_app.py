@@ -0,0 +1,147 @@
+import datetime as dt
+import importlib
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+HERE = os.path.dirname(__file__)
+APP_DIR = os.path.abspath(os.path.join(HERE, '..'))
+sys.path.insert(0, APP_DIR)
+
+PRECOMPUTE = os.path.abspath(os.path.join(APP_DIR, '..', 'scripts', 'precompute_summaries.py'))
+START, END = dt.date(2023, 1, 1), dt.date(2023, 3, 1)
+
+pytest.importorskip('duckdb')
+
+
+def _write_raw(raw_dir, n=3000):
+    rng = np.random.default_rng(0)
+    created = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 86400 * 60, n), unit='s')
+    closed = pd.Series(created + pd.to_timedelta(rng.exponential(30 * 3600, n), unit='s'))
+    closed[rng.random(n) < 0.1] = pd.NaT
+    borough = rng.choice(['BRONX', 'BROOKLYN', 'QUEENS'], n)
+    complaint = rng.choice(['Noise - Residential', 'HEAT/HOT WATER'], n).astype(object)
+    # a complaint type that only ever appears in QUEENS
+    complaint[(borough == 'QUEENS') & (rng.random(n) < 0.2)] = 'Rodent'
+    borough = borough.astype(object)
+    borough[rng.random(n) < 0.05] = None
+    df = pd.DataFrame({
+        'unique_key': [str(i) for i in range(n)], 'created_date': created, 'closed_date': closed,
+        'resolution_action_updated_date': pd.Series(created + pd.Timedelta(hours=40)),
+        'agency': 'NYPD', 'complaint_type': complaint, 'descriptor': 'x', 'status': 'Closed',
+        'borough': borough, 'incident_zip': '10001', 'city': 'NEW YORK',
+        'open_data_channel_type': 'PHONE', 'latitude': 40.7, 'longitude': -73.9,
+    })
+    df.to_parquet(raw_dir / 'nyc311_2023-01-01_00000.parquet', index=False)
+
+
+@pytest.fixture(scope='module')
+def data_dir(tmp_path_factory):
+    import process_311
+    root = tmp_path_factory.mktemp('app')
+    (root / 'data' / 'raw').mkdir(parents=True)
+    _write_raw(root / 'data' / 'raw')
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        process_311.main()
+        subprocess.run([sys.executable, PRECOMPUTE, '--sla', '24'], check=True, capture_output=True)
+        yield root
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope='module')
+def app_module(data_dir):
+    # importing the page runs it once in Streamlit's bare mode; the query helpers are then
+    # plain (cached) functions on the module
+    mp = pytest.MonkeyPatch()
+    mp.chdir(data_dir)
+    mp.setenv('DUCKDB_PATH', ':memory:')
+    sys.modules.pop('app_streamlit', None)
+    try:
+        yield importlib.import_module('app_streamlit')
+    finally:
+        sys.modules.pop('app_streamlit', None)
+        mp.undo()
+
+
+@pytest.fixture
+def app(app_module, data_dir, monkeypatch):
+    import streamlit as st
+    monkeypatch.chdir(data_dir)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    return app_module
+
+
+@pytest.mark.parametrize('sla', [24, 30])
+def test_empty_selection(app, sla):
+    # BRONX has no 'Rodent' tickets: preset SLAs go through the cube, others through raw rows
+    aggs = app.all_aggregates_query(START, END, ['BRONX'], ['Rodent'], sla, 10)
+    assert aggs['kpi']['tickets'] == 0
+    assert aggs['top_types'].empty and aggs['seasonality'].empty and aggs['dow'].empty
+
+
+def test_preset_sla_never_reads_raw_rows(app):
+    # the cube answers preset SLAs on its own, medians included
+    app.get_con().execute('DROP VIEW nyc')
+    aggs = app.all_aggregates_query(START, END, [], [], 48, 10)
+    assert aggs['kpi']['tickets'] > 0 and not np.isnan(aggs['kpi']['med_hrs'])
+
+
+def test_missing_borough_is_a_real_partition(app, data_dir):
+    # hive writes null keys as __HIVE_DEFAULT_PARTITION__, which duckdb 1.1 reads back verbatim
+    boroughs = [r[0] for r in app.get_con().execute("SELECT DISTINCT borough FROM nyc").fetchall()]
+    assert sorted(boroughs) == ['BRONX', 'BROOKLYN', 'QUEENS', 'Unspecified']
+    assert 'Unspecified' in pd.read_parquet(data_dir / 'data' / 'summaries' / 'boroughs.parquet')['borough'].tolist()
+
+
+def _medians(aggs):
+    season = aggs['seasonality'].sort_values(['dow_name', 'hour'])
+    return (aggs['kpi']['med_hrs'], season['median_response'].tolist(),
+            aggs['dow'].sort_values('dow_name')['median_response'].tolist())
+
+
+def test_medians_do_not_depend_on_sla(app):
+    # 24 is answered from the cube, 25 from raw rows; medians must agree across the two
+    a24 = app.all_aggregates_query(START, END, [], [], 24, 10)
+    a25 = app.all_aggregates_query(START, END, [], [], 25, 10)
+    assert len(a24['seasonality']) > 100 and len(a24['dow']) == 7
+    assert _medians(a24) == _medians(a25)
+
+
+def test_large_slices_are_not_copied(app, monkeypatch):
+    # over FILT_MAX_ROWS the aggregates read nyc in place and give the same answer
+    import streamlit as st
+    expected = app.all_aggregates_query(START, END, [], [], 25, 10)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    monkeypatch.setattr(app, 'FILT_MAX_ROWS', 100)
+    got = app.all_aggregates_query(START, END, [], [], 25, 10)
+    temp = app.get_con().execute(
+        "SELECT count(*) FROM duckdb_tables() WHERE temporary AND table_name LIKE 'filt_%'").fetchone()[0]
+    assert temp == 0
+    pd.testing.assert_series_equal(got['kpi'], expected['kpi'])
+    pd.testing.assert_frame_equal(got['seasonality'], expected['seasonality'])
+
+
+def test_rebuilt_dataset_is_picked_up(app, tmp_path, monkeypatch):
+    # temp tables outlive cache_data; a rebuilt processed_part must not be answered from them
+    import process_311
+    import streamlit as st
+    (tmp_path / 'data' / 'raw').mkdir(parents=True)
+    _write_raw(tmp_path / 'data' / 'raw', n=1000)
+    monkeypatch.chdir(tmp_path)
+    process_311.main()
+    before = app.all_aggregates_query(START, END, [], [], 25, 10)['kpi']['tickets']
+
+    _write_raw(tmp_path / 'data' / 'raw', n=2000)
+    process_311.main()
+    st.cache_data.clear()  # stands in for the TTL running out; the connection stays warm
+    after = app.all_aggregates_query(START, END, [], [], 25, 10)['kpi']['tickets']
+    assert after != before
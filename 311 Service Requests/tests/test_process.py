@@ -0,0 +1,67 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import process_311
+from process_311 import engineer
+
+
+def _frame():
+    # naive timestamps are UTC; 02:00Z on Jul 5 is still Jul 4 in New York
+    created = pd.to_datetime(['2023-07-05 02:00', '2023-07-04 02:00', '2023-07-10 12:00', '2023-07-11 12:00'])
+    return pd.DataFrame({
+        'unique_key': ['a', 'b', 'c', 'd'],
+        'created_date': created,
+        'closed_date': pd.to_datetime(['2023-07-05 12:00', None, None, '2023-07-13 12:00']),
+        'resolution_action_updated_date': pd.to_datetime([None, '2023-07-04 20:00', None, None]),
+        'borough': ['BRONX', 'QUEENS', None, 'BROOKLYN'],
+        'complaint_type': ['Noise', 'Noise', 'Rodent', 'Rodent'],
+        'city': [' new york ', None, None, 'BROOKLYN'],
+    })
+
+
+def test_open_tickets_have_no_response():
+    out = engineer(_frame())
+    # closed_date wins; else the resolution update; neither -> still open
+    assert out['response_hours'].tolist()[:2] == [10.0, 18.0]
+    assert np.isnan(out['response_hours'].iloc[2])
+    assert pd.isna(out['response_minutes'].iloc[2])
+    assert out['within_sla'].tolist() == [True, True, False, False]
+
+
+@pytest.mark.skipif(not process_311._HOLIDAYS_AVAILABLE, reason='holidays not installed')
+def test_holidays_use_new_york_day():
+    out = engineer(_frame())
+    assert out['is_holiday'].tolist() == [True, False, False, False]
+    assert out['dow_name'].iloc[0] == 'Tuesday'
+    assert out['hour'].iloc[0] == 22
+
+
+def test_city_falls_back_to_borough_then_unknown():
+    out = engineer(_frame())
+    assert out['city'].tolist() == ['New York', 'Queens', 'Unknown', 'Brooklyn']
+
+
+def test_numba_matches_numpy(monkeypatch):
+    pytest.importorskip('numba')
+    rng = np.random.default_rng(0)
+    n = 500
+    created = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 86400 * 30, n), unit='s')
+    closed = pd.Series(created + pd.to_timedelta(rng.exponential(30 * 3600, n), unit='s'))
+    closed[rng.random(n) < 0.3] = pd.NaT
+    resolved = pd.Series(created + pd.to_timedelta(rng.exponential(40 * 3600, n), unit='s'))
+    resolved[rng.random(n) < 0.3] = pd.NaT
+    df = pd.DataFrame({'unique_key': np.arange(n).astype(str), 'created_date': created,
+                       'closed_date': closed, 'resolution_action_updated_date': resolved})
+
+    expected = engineer(df)
+    monkeypatch.setattr(process_311, 'NUMBA_MIN_ROWS', 0)
+    got = engineer(df)
+    np.testing.assert_allclose(got['response_hours'], expected['response_hours'], equal_nan=True)
+    assert got['within_sla'].tolist() == expected['within_sla'].tolist()
+    assert got['response_minutes'].equals(expected['response_minutes'])
@@ -2,7 +2,7 @@
 """Generate a small sample parquet file for demo/Cloud use.
 
 Writes `data/sample/nyc311_50k.parquet` by default. Prefers partitioned dataset
-`data/processed_part/*/*/part-*.parquet` when present, else falls back to
+`data/processed_part/**/*.parquet` (Hive layout) when present, else falls back to
 `data/processed/nyc311_clean.parquet`.
 
 Usage:
@@ -28,17 +28,20 @@ def main():
     args = get_args()
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     # prefer partitioned dataset
-    part_glob = "data/processed_part/*/*/part-*.parquet"
+    part_glob = "data/processed_part/**/*.parquet"
     single = "data/processed/nyc311_clean.parquet"
-    base = part_glob if Path("data/processed_part").exists() else single
+    if Path("data/processed_part").exists():
+        # year/month/borough live in the directory names
+        source = f"parquet_scan('{part_glob}', hive_partitioning=1)"
+    else:
+        source = f"parquet_scan('{single}')"
 
     con = duckdb.connect()
-    # use random sampling via DuckDB to avoid loading everything into Python
+    # reservoir sampling in one pass (no full sort by a random key); seeded so reruns match
     sql = f"""
         CREATE OR REPLACE TABLE sample AS
-        SELECT * FROM parquet_scan('{base}')
-        ORDER BY RANDOM()
-        LIMIT {int(args.rows)}
+        SELECT * FROM {source}
+        USING SAMPLE {int(args.rows)} ROWS (reservoir, 42)
     """
     try:
         con.execute(sql)
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-"""Health check script: runs a small DuckDB query against the partitioned parquet dataset.
+"""Health check script: counts rows of the partitioned parquet dataset from the file footers.
 Exits 0 on success, non-zero on failure. Prints summary output.
 
 Usage: .venv312/bin/python scripts/health_check.py
@@ -13,7 +13,8 @@ except Exception as e:
 
 try:
     conn = duckdb.connect(':memory:')
-    df = conn.execute("select count(*) as cnt from parquet_scan('data/processed_part/*/*/part-*.parquet')").df()
+    # row counts straight from the Parquet footers (one row per file), no column data read
+    df = conn.execute("select sum(num_rows) as cnt from parquet_file_metadata('data/processed_part/**/*.parquet')").df()
     cnt = int(df['cnt'].iloc[0])
     print('rows:', cnt)
     if cnt < 1000:
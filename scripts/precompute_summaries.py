@@ -3,15 +3,19 @@
 Writes files to `data/summaries/`:
  - daily_summary.parquet: date, borough, complaint_type, tickets, median_response, pct_within
  - complaint_type_summary.parquet: complaint_type, borough, tickets, breach_rate (aggregated over all dates)
- - dow_hour_summary.parquet: dow_name, hour, borough, complaint_type, tickets, breach_rate, median_response
+ - cube.parquet/ (Hive-partitioned by year, month): date, borough, complaint_type, hour, dow (1=Mon),
+   tickets, resolved, breach_cnt_24, breach_cnt_48, breach_cnt_72, median_response
+ - boroughs.parquet / complaints.parquet: distinct filter values with their min/max date,
+   so the app's sidebar metadata doesn't need a full scan on cold start
 
 Usage:
   .venv312/bin/python scripts/precompute_summaries.py --sla 24
 
 """
 import argparse
+import os
+import shutil
 import duckdb
-import pandas as pd
 from pathlib import Path
 
 parser = argparse.ArgumentParser()
@@ -21,8 +25,20 @@ args = parser.parse_args()
 
 OUT = Path(args.out_dir)
 OUT.mkdir(parents=True, exist_ok=True)
-BASE = "data/processed_part/*/*/part-*.parquet"
+BASE = "data/processed_part/**/*.parquet"
 con = duckdb.connect()
+con.execute(f"PRAGMA threads={os.cpu_count() or 4}")
+con.execute("PRAGMA enable_object_cache=true")
+
+# read the processed dataset once: only the columns the summaries use (year/month are the
+# hive partition keys, so they cost nothing to decode); every summary below derives from it
+print('Loading source columns...')
+con.execute(f"""
+CREATE TEMP TABLE src AS
+SELECT created_dt, year, month, borough, complaint_type, response_hours
+FROM parquet_scan('{BASE}', hive_partitioning=1)
+WHERE created_dt IS NOT NULL
+""")
 
 print('Computing daily_summary...')
 sla = args.sla
@@ -34,8 +50,7 @@ SELECT
     count(*) as tickets,
     median(response_hours) as median_response,
     avg(CASE WHEN response_hours <= {sla} THEN 1 ELSE 0 END) as pct_within
-FROM parquet_scan('{BASE}')
-WHERE created_dt IS NOT NULL
+FROM src
 GROUP BY 1,2,3
 ORDER BY 1 DESC
 """
@@ -44,47 +59,62 @@ df_daily.to_parquet(OUT / 'daily_summary.parquet', index=False)
 print('Wrote', OUT / 'daily_summary.parquet', 'rows:', len(df_daily))
 
 print('Computing complaint_type_summary (aggregated over dates)...')
-# Aggregate the daily_summary into complaint_type x borough over the full period
-if len(df_daily):
-    df_ct = (
-        df_daily.groupby(['complaint_type','borough'], dropna=False, observed=True)
-        .agg(tickets=('tickets','sum'),
-             breaches=('tickets', lambda s: 0) # placeholder, will compute below
-        )
-        .reset_index()
-    )
-    # compute breaches and breach_rate correctly using weighted average from daily
-    # To compute breaches: sum over rows of tickets*(1-pct_within)
-    df_daily['breaches'] = df_daily['tickets'] * (1.0 - df_daily['pct_within'])
-    df_ct = (
-        df_daily.groupby(['complaint_type','borough'], dropna=False, observed=True)
-        .agg(tickets=('tickets','sum'), breaches=('breaches','sum'))
-        .reset_index()
-    )
-    df_ct['breach_rate'] = (df_ct['breaches'] / df_ct['tickets']).fillna(0.0)
-    df_ct = df_ct[['complaint_type','borough','tickets','breach_rate']]
-    df_ct.to_parquet(OUT / 'complaint_type_summary.parquet', index=False)
-    print('Wrote', OUT / 'complaint_type_summary.parquet', 'rows:', len(df_ct))
-else:
-    print('No daily rows to aggregate for complaint_type_summary')
-
-print('Computing dow_hour_summary...')
-sql_dow = f"""
+# breach = not within SLA, so open tickets count as breaches (same as 1 - pct_within above)
+sql_ct = f"""
 SELECT
-    strftime(created_dt, '%A') as dow_name,
-    extract(hour from created_dt) as hour,
-    borough,
     complaint_type,
+    borough,
     count(*) as tickets,
-    avg(CASE WHEN response_hours > {sla} THEN 1 ELSE 0 END) as breach_rate,
-    median(response_hours) as median_response
-FROM parquet_scan('{BASE}')
-WHERE created_dt IS NOT NULL
-GROUP BY 1,2,3,4
-ORDER BY 1,2
+    avg(CASE WHEN response_hours <= {sla} THEN 0 ELSE 1 END) as breach_rate
+FROM src
+GROUP BY 1,2
 """
-df_dow = con.execute(sql_dow).df()
-df_dow.to_parquet(OUT / 'dow_hour_summary.parquet', index=False)
-print('Wrote', OUT / 'dow_hour_summary.parquet', 'rows:', len(df_dow))
+df_ct = con.execute(sql_ct).df()
+df_ct.to_parquet(OUT / 'complaint_type_summary.parquet', index=False)
+print('Wrote', OUT / 'complaint_type_summary.parquet', 'rows:', len(df_ct))
+
+print('Computing cube (date x borough x complaint_type x hour rollup)...')
+# breach counts for the dashboard's preset SLAs let the app answer any of them from the cube;
+# medians can't be re-aggregated exactly, so each cell keeps its own median and the app takes
+# a resolved-weighted median of the selected cells
+cube_dir = OUT / 'cube.parquet'
+shutil.rmtree(cube_dir, ignore_errors=True)
+sql_cube = f"""
+COPY (
+    SELECT
+        year, month,
+        CAST(created_dt AS DATE) as date,
+        borough,
+        complaint_type,
+        hour(created_dt) as hour,
+        isodow(created_dt) as dow,
+        count(*) as tickets,
+        count(response_hours) as resolved,
+        count(*) FILTER (WHERE response_hours > 24) as breach_cnt_24,
+        count(*) FILTER (WHERE response_hours > 48) as breach_cnt_48,
+        count(*) FILTER (WHERE response_hours > 72) as breach_cnt_72,
+        median(response_hours) as median_response
+    FROM src
+    GROUP BY ALL
+) TO '{cube_dir}' (FORMAT PARQUET, PARTITION_BY (year, month))
+"""
+con.execute(sql_cube)
+print('Wrote', cube_dir)
+
+print('Computing filter metadata...')
+for col, fn in [('borough', 'boroughs.parquet'), ('complaint_type', 'complaints.parquet')]:
+    sql_meta = f"""
+    SELECT
+        {col},
+        CAST(min(created_dt) AS DATE) as min_date,
+        CAST(max(created_dt) AS DATE) as max_date
+    FROM src
+    WHERE {col} IS NOT NULL AND {col} <> ''
+    GROUP BY 1
+    ORDER BY 1
+    """
+    df_meta = con.execute(sql_meta).df()
+    df_meta.to_parquet(OUT / fn, index=False)
+    print('Wrote', OUT / fn, 'rows:', len(df_meta))
 
 print('Done.')
@@ -1,12 +1,15 @@
 import pandas as pd
+import pyarrow.parquet as pq
 
 
 def test_processed_schema():
-    df = pd.read_parquet("data/processed/nyc311_clean.parquet")
+    path = "data/processed/nyc311_clean.parquet"
     expected = {
         "unique_key","created_dt","borough","complaint_type","descriptor",
         "response_hours","within_sla","hour","dow_name","month_name"
     }
-    assert expected.issubset(df.columns)
+    # column set from the footer; only the two columns the invariants need are read
+    assert expected.issubset(pq.read_schema(path).names)
+    df = pd.read_parquet(path, columns=["unique_key","response_hours"])
     assert df["unique_key"].is_unique
     assert (df["response_hours"].dropna() >= 0).all()